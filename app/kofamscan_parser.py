@@ -4,30 +4,53 @@
 import os
 import sys
 import argparse
-from dataclasses import dataclass
-from typing import Dict, List, Set
+from array import array
+from collections import defaultdict
+from itertools import chain, compress
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
 from version import __version__
 
+# Header lines of the gene and detail outputs
+_GENE_HEADER = "KO\tgene name\tthrshld\tscore\tE-value\tmark"
+_DETAIL_HEADER = "hit\trank\tasterisk_mark\tgene\tKO\tthreshold\tscore\te_value\tKO_definition"
 
-@dataclass
-class Row:
-    """Data class representing a hit row information"""
-    asterisk: bool
-    original_columns: List[str]
-    ko: str
-    gene: str
-    thrshld: float
-    score: float
-
+# Separator line written between genes in the detail output
+_SEPARATOR = '-' * 100
 
-def group_by_genes(result: str):
-    """Parse TSV file content and convert to data structure."""
-    gene_data: Dict[str, List[Row]] = {}
 
-    for line in result.splitlines():
+@dataclass
+class HitTable:
+    """Column-oriented store of hit rows (one list/array per column)"""
+    asterisk: bytearray = field(default_factory=bytearray)
+    ko: List[str] = field(default_factory=list)
+    thrshld: array = field(default_factory=lambda: array('d'))
+    score: array = field(default_factory=lambda: array('d'))
+    # Original columns except the first one, tab-joined as read
+    tail: List[str] = field(default_factory=list)
+    # Row indices of each gene, in order of first appearance
+    genes: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def group_by_genes(lines: Iterable[str]):
+    """Parse TSV lines (e.g. an open file) and convert to data structure."""
+    table = HitTable()
+    gene_data: Dict[str, List[int]] = defaultdict(list)
+
+    # Bind the column appends once instead of looking them up per row
+    add_asterisk = table.asterisk.append
+    add_ko = table.ko.append
+    add_thrshld = table.thrshld.append
+    add_score = table.score.append
+    add_tail = table.tail.append
+    intern = sys.intern
+    row = 0
+
+    for line in lines:
         line = line.rstrip()
 
-        # Save the first comment line as header if it exists
+        # Skip comment (header) lines
         if line.startswith('#'):
             continue
 
@@ -35,149 +58,142 @@ def group_by_genes(result: str):
         if not line:
             continue
 
-        columns = line.split('\t')
-        if len(columns) < 7:
+        # Keep everything after the asterisk column as-is for the detail output
+        asterisk_mark, _, tail = line.partition('\t')
+        # Only columns up to the E-value are needed; stop splitting there
+        columns = tail.split('\t', 5)
+        if len(columns) < 6:
             continue
 
+        # Save row index by gene (gene names are interned for the genes keys)
+        gene = intern(columns[0])
+        gene_data[gene].append(row)
+        row += 1
+
         # Parse columns
-        asterisk_mark = columns[0] == '*'
-        gene = columns[1]
-        ko = columns[2]
+        add_asterisk(asterisk_mark == '*')
+        # KO IDs repeat across genes, so the ko column shares one string per KO
+        add_ko(intern(columns[1]))
         # Handle empty thrshld/score (some KOs have no threshold defined)
-        thrshld = float(columns[3]) if columns[3] else 0.0
-        score = float(columns[4]) if columns[4] else 0.0
-
-        # Save hits by gene
-        if gene not in gene_data:
-            gene_data[gene] = []
-
-        hit = Row(
-            asterisk=asterisk_mark,
-            original_columns=columns,
-            ko=ko,
-            gene=gene,
-            thrshld=thrshld,
-            score=score
-        )
-        gene_data[gene].append(hit)
-    
-    return gene_data
+        add_thrshld(float(columns[2]) if columns[2] else 0.0)
+        add_score(float(columns[3]) if columns[3] else 0.0)
+        add_tail(tail)
 
+    table.genes = dict(gene_data)
+    return table
 
-def determine_selected_indices(hits: List[Row], top_n: int, min_score_ratio: float = None):
-    """
-    Determine which hit indices should be selected for KO output.
-    Returns set of indices that should be selected.
 
-    If min_score_ratio is specified, hits without asterisk are only selected
-    if score/thrshld >= min_score_ratio.
+def read_hits(file_path: str) -> HitTable:
+    """Stream a KofamScan result file into a HitTable."""
+    with open(file_path, 'r') as file:
+        return group_by_genes(file)
+
+
+def build_selection(table: HitTable, top_n: int, min_score_ratio: float = None):
     """
-    selected_indices = set()
-    has_asterisk = any(hit.asterisk for hit in hits)
+    Determine the hits selected for KO output across the whole table.
+    Returns a bytearray mask (1 = selected) aligned with the table rows.
 
-    for index, hit in enumerate(hits):
-        # Ratio check: if min_score_ratio is specified, check score/thrshld ratio
-        if min_score_ratio is not None and hit.thrshld > 0:
-            passes_ratio_check = (hit.score / hit.thrshld) >= min_score_ratio
+    If a gene has any asterisk hit, exactly its asterisk hits are selected.
+    Otherwise its top_n hits are selected; if min_score_ratio is specified,
+    they are only selected if score/thrshld >= min_score_ratio.
+    """
+    asterisk = table.asterisk
+    thrshld = table.thrshld
+    score = table.score
+    selected = bytearray(len(asterisk))
+    # A negative top_n selects nothing (avoid slicing from the end)
+    top_n = max(top_n, 0)
+
+    is_asterisk = asterisk.__getitem__
+
+    # Works on row indices and the numeric columns only, writing straight into the mask;
+    # the per-gene asterisk scan is a single compress/map pass in C
+    for rows in table.genes.values():
+        asterisk_rows = list(compress(rows, map(is_asterisk, rows)))
+        if asterisk_rows:
+            for row in asterisk_rows:
+                selected[row] = True
+        elif min_score_ratio is None:
+            for row in rows[:top_n]:
+                selected[row] = True
         else:
-            passes_ratio_check = True  # No filtering if not specified or thrshld is 0
-
-        # Mark as selected if: has asterisk OR (no asterisk in gene and within top_n and passes ratio check)
-        if hit.asterisk or (not has_asterisk and index < top_n and passes_ratio_check):
-            selected_indices.add(index)
+            for row in rows[:top_n]:
+                # Ratio check: no filtering if thrshld is 0
+                selected[row] = thrshld[row] <= 0 or score[row] / thrshld[row] >= min_score_ratio
 
-    return selected_indices
+    return selected
 
 
-def format_detail_output(gene_data: Dict[str, List[Row]], top_n: int, detail_top: int, min_score_ratio: float = None):
+def format_detail_output(table: HitTable, selected: bytearray, detail_top: int):
     """
     Generate output lines for detail mode.
     Output the Top N results specified by the detail_top argument, and mark selected KO numbers with 'Y' in the hit column.
     """
-    output_lines = []
-
     # Write header
-    output_lines.append("hit\trank\tasterisk_mark\tgene\tKO\tthreshold\tscore\te_value\tKO_definition")
+    yield _DETAIL_HEADER
+
+    # Bind lookups used in the row loop
+    tab_join = '\t'.join
+    asterisks = table.asterisk
+    is_asterisk = asterisks.__getitem__
+    tails = table.tail
 
     # Process each gene
-    for i, (gene, hits) in enumerate(gene_data.items()):
+    for i, rows in enumerate(table.genes.values()):
 
         # Add separator line between genes (except before the first gene)
         if i > 0:
-            output_lines.append('-' * 100)
-
-        # Use common function to determine which rows would be selected
-        selected_indices = determine_selected_indices(hits, top_n, min_score_ratio)
+            yield _SEPARATOR
 
-        # Output hits up to detail_top
-        for index, hit in enumerate(hits):
-            if index < detail_top or hit.asterisk:
-                original_rank = index + 1
-                # Mark with 'Y' if this row would be selected for KO output
-                hit_mark = 'Y' if index in selected_indices else ''
-                asterisk_mark = '*' if hit.asterisk else ''
-                
-                # Output: rank, hit mark, asterisk_mark, then all original columns except the first one
-                cols_str = '\t'.join(hit.original_columns[1:])
-                output_lines.append(f"{hit_mark}\t{original_rank}\t{asterisk_mark}\t{cols_str}")
+        # Output hits up to detail_top, then asterisk hits ranked below it;
+        # the rows past detail_top are filtered in C rather than tested one by one
+        lower_rows = rows[detail_top:]
+        shown = chain(enumerate(rows[:detail_top]),
+                      compress(enumerate(lower_rows, detail_top), map(is_asterisk, lower_rows)))
+        for index, row in shown:
+            # Mark with 'Y' if this row would be selected for KO output
+            hit_mark = 'Y' if selected[row] else ''
+            asterisk_mark = '*' if asterisks[row] else ''
 
-    return output_lines
+            # Output: hit mark, rank, asterisk_mark, then all original columns except the first one
+            yield tab_join((hit_mark, str(index + 1), asterisk_mark, tails[row]))
 
 
-def format_ko_output(gene_data: Dict[str, List[Row]], top_n: int, min_score_ratio: float = None):
+def format_ko_output(table: HitTable, selected: bytearray):
     """Generate output lines for KO-only mode."""
-    unique_kos: Set[str] = set()
-
-    # Process each gene
-    for gene_name, hits in gene_data.items():
-        # Use common function to determine which rows to select
-        selected_indices = determine_selected_indices(hits, top_n, min_score_ratio)
+    # Return sorted unique KOs of the selected rows
+    return sorted(set(compress(table.ko, selected)))
 
-        # Add KOs from selected indices
-        for index in selected_indices:
-            if index < len(hits):
-                unique_kos.add(hits[index].ko)
 
-    # Return sorted unique KOs
-    return sorted(unique_kos)
-
-
-def format_gene_output(gene_data: Dict[str, List[Row]], top_n: int, min_score_ratio: float = None):
+def format_gene_output(table: HitTable, selected: bytearray):
     """Generate output lines for gene mode with detailed hit information."""
-    output_lines = []
-
     # Write header
-    output_lines.append("KO\tgene name\tthrshld\tscore\tE-value\tmark")
+    yield _GENE_HEADER
 
     # Process each gene
-    for gene_name, hits in gene_data.items():
-        # Use common function to determine which rows to select
-        selected_indices = determine_selected_indices(hits, top_n, min_score_ratio)
-
+    for rows in table.genes.values():
         # Output selected hits
-        for index in selected_indices:
-            if index < len(hits):
-                hit = hits[index]
-                # Extract relevant columns from original data
-                # columns[0] = asterisk mark, columns[1] = gene, columns[2] = KO
-                # columns[3] = thrshld, columns[4] = score, columns[5] = E-value
-                cols = hit.original_columns
-                ko = cols[2]
-                gene = cols[1]
-                thrshld = cols[3] if len(cols) > 3 else ''
-                score = cols[4] if len(cols) > 4 else ''
-                e_value = cols[5] if len(cols) > 5 else ''
-                mark = '*' if hit.asterisk else ''
-
-                output_lines.append(f"{ko}\t{gene}\t{thrshld}\t{score}\t{e_value}\t{mark}")
-
-    return output_lines
-
-
-def load_tsv(file_path: str):
-    """Read a TSV file and return its content as string."""
-    with open(file_path, 'r') as file:
-        return file.read()
+        for row in compress(rows, map(selected.__getitem__, rows)):
+            # Extract relevant columns from original data; group_by_genes only keeps
+            # rows with all columns, so the unpacking always succeeds
+            gene, ko, thrshld, score, e_value, _ = table.tail[row].split('\t', 5)
+            mark = '*' if table.asterisk[row] else ''
+
+            yield '\t'.join((ko, gene, thrshld, score, e_value, mark))
+
+
+def write_lines(file_path: str, lines: Iterable[str]):
+    """
+    Stream lines to a file through a 1 MiB buffer.
+    Lines are separated by newlines, without a trailing newline.
+    """
+    lines = iter(lines)
+    with open(file_path, 'w', encoding='utf-8', buffering=1 << 20) as out:
+        first_line = next(lines, None)
+        if first_line is not None:
+            out.write(first_line)
+            out.writelines('\n' + line for line in lines)
 
 
 def generate_output_filename(base_file: str, suffix: str) -> str:
@@ -189,35 +205,30 @@ def generate_output_filename(base_file: str, suffix: str) -> str:
         return f"{base_file}_{suffix}"
 
 
-def parse_kofamscan_result_file(input_file: str, output_file: str, top_n: int = 1, min_score_ratio: float = None):
-    """Parse the KofamScan result file and output three files: KO list, gene details, and detail view"""
-    # Load input KofamScan result file
-    kofamscan_results = load_tsv(input_file)
-
-    # Parse KofamScan results and group by genes
-    gene_data = group_by_genes(kofamscan_results)
-
+def write_result_files(table: HitTable, output_file: str, top_n: int = 1, min_score_ratio: float = None):
+    """Output three files from the parsed hits: KO list, gene details, and detail view"""
     # Generate output filenames
     gene_output_file = generate_output_filename(output_file, "gene")
     detail_output_file = generate_output_filename(output_file, "detail")
 
+    # Determine the selected hits once for all outputs
+    selected = build_selection(table, top_n, min_score_ratio)
+
     # Output 1: KO list only (default)
-    ko_lines = format_ko_output(gene_data, top_n, min_score_ratio)
-    with open(output_file, 'w', encoding='utf-8') as out:
-        if ko_lines:
-            out.write('\n'.join(ko_lines))
+    write_lines(output_file, format_ko_output(table, selected))
 
     # Output 2: Gene details
-    gene_lines = format_gene_output(gene_data, top_n, min_score_ratio)
-    with open(gene_output_file, 'w', encoding='utf-8') as out:
-        if gene_lines:
-            out.write('\n'.join(gene_lines))
+    write_lines(gene_output_file, format_gene_output(table, selected))
 
     # Output 3: Detail view (detail_top is fixed at 10)
-    detail_lines = format_detail_output(gene_data, top_n, detail_top=10, min_score_ratio=min_score_ratio)
-    with open(detail_output_file, 'w', encoding='utf-8') as out:
-        if detail_lines:
-            out.write('\n'.join(detail_lines))
+    write_lines(detail_output_file, format_detail_output(table, selected, detail_top=10))
+
+
+def parse_kofamscan_result_file(input_file: str, output_file: str, top_n: int = 1, min_score_ratio: float = None):
+    """Parse the KofamScan result file and output three files: KO list, gene details, and detail view"""
+    # Parse KofamScan results and group by genes
+    table = read_hits(input_file)
+    write_result_files(table, output_file, top_n, min_score_ratio)
 
 
 def main():
@@ -256,17 +267,27 @@ def main():
         print(f"Error: Input file '{args.input_file}' does not exist")
         sys.exit(1)
     
-    # Check that output directory exists and is writable
-    out_dir = os.path.dirname(args.output_file) or '.'
-    if not os.path.isdir(out_dir):
-        print(f"Error: Output directory '{out_dir}' does not exist.", file=sys.stderr)
+    # Parse the KofamScan result file
+    try:
+        table = read_hits(args.input_file)
+    except IOError as e:
+        print(f"Error: Cannot open input file '{args.input_file}': {e}", file=sys.stderr)
         sys.exit(1)
-    if not os.access(out_dir, os.W_OK):
-        print(f"Error: No write permission in output directory '{out_dir}'.", file=sys.stderr)
+
+    # Create the output directory if it does not exist
+    out_dir = Path(args.output_file).parent
+    try:
+        out_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"Error: Cannot create output directory '{out_dir}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Output three files
+    try:
+        write_result_files(table, args.output_file, args.top, args.min_score_ratio)
+    except PermissionError as e:
+        print(f"Error: No write permission for '{e.filename}'.", file=sys.stderr)
         sys.exit(1)
-    
-    # Parse the KofamScan result file and output three files
-    parse_kofamscan_result_file(args.input_file, args.output_file, args.top, args.min_score_ratio)
 
 
 if __name__ == "__main__":
@@ -4,19 +4,24 @@
 import json
 import os
 import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 from version import __version__
 
-def load_json(path):
+# A compiled definition: takes the set of KO IDs and returns whether it is satisfied
+Predicate = Callable[[FrozenSet[str]], bool]
+
+def load_json(path: str) -> Dict[str, Any]:
     """Load a JSON file"""
     with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def load_tsv(path):
+def load_tsv(path: str) -> List[str]:
     """
     Read a TSV file and return a list of KO numbers from the first column.
     Skip any empty lines.
     """
-    ids = []
+    ids: List[str] = []
     with open(path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
@@ -26,38 +31,95 @@ def load_tsv(path):
             ids.append(ko)
     return ids
 
-def evaluate(defn, ids):
+def satisfies_at_least(results: Iterable[bool], total: int, required: int) -> bool:
+    """
+    Return whether at least `required` of the `total` boolean results are true.
+    `results` is consumed lazily and evaluation stops as soon as the outcome is decided.
+    """
+    hits = 0
+    remaining = total
+    for result in results:
+        remaining -= 1
+        if result:
+            hits += 1
+            if hits >= required:
+                return True
+        elif hits + remaining < required:
+            return False
+    return hits >= required
+
+def definition_key(defn: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Return a hashable key for what a definition object evaluates.
+    Descriptive fields such as `enzyme_name` and `ec` are ignored.
+    """
+    if "id_list" in defn:
+        return (defn.get("type"), defn.get("min"), tuple(defn["id_list"]))
+    return (defn.get("type"), defn.get("min"), tuple(definition_key(sub) for sub in defn.get("list", [])))
+
+def remember_last(fn: Predicate) -> Predicate:
+    """Wrap a compiled definition so repeated calls with the same ids object reuse the last result."""
+    last_ids: Optional[FrozenSet[str]] = None
+    last_result = False
+
+    def wrapper(ids: FrozenSet[str]) -> bool:
+        nonlocal last_ids, last_result
+        if ids is not last_ids:
+            last_result = fn(ids)
+            last_ids = ids
+        return last_result
+
+    return wrapper
+
+def compile_definition(defn: Dict[str, Any], cache: Optional[Dict[Tuple[Any, ...], Predicate]] = None) -> Predicate:
+    """
+    Compile a definition object into a function that takes the ids (frozenset of KO IDs)
+    and returns whether they satisfy it. The tree is walked only once, here.
+    Identical subtrees share one compiled function through `cache`.
     """
-    Recursively evaluate a definition object and return whether the ids (list of KO IDs) satisfy it.
+    if cache is None:
+        cache = {}
+    key = definition_key(defn)
+    if key not in cache:
+        cache[key] = compile_node(defn, cache)
+    return cache[key]
+
+def compile_node(defn: Dict[str, Any], cache: Dict[Tuple[Any, ...], Predicate]) -> Predicate:
+    """
+    Compile a single definition node (see compile_definition).
     The defn['type'] is one of "all_of", "one_of", or "at_least".
     """
     t = defn.get("type")
     # Leaf node: when `id_list` is present
     if "id_list" in defn:
-        id_list = defn["id_list"]
+        id_list = tuple(defn["id_list"])
         if t == "all_of":
-            return all(k in ids for k in id_list)
+            id_set = frozenset(id_list)
+            return lambda ids: ids.issuperset(id_set)
         elif t == "one_of":
-            return any(k in ids for k in id_list)
+            id_set = frozenset(id_list)
+            return lambda ids: not ids.isdisjoint(id_set)
         elif t == "at_least":
+            # Kept as a tuple: duplicate IDs count separately and the scan can stop early
             required = defn.get("min", len(id_list))
-            return sum(1 for k in id_list if k in ids) >= required
+            return lambda ids: satisfies_at_least(map(ids.__contains__, id_list), len(id_list), required)
         else:
             raise ValueError(f"Unknown leaf type: {t}")
 
-    # Composite node: evaluate the elements under `list`
-    subs = defn.get("list", [])
+    # Composite node: compile the elements under `list`; the result is remembered per ids
+    # so a subtree shared by several pathways is evaluated once
+    subs = tuple(compile_definition(sub, cache) for sub in defn.get("list", []))
     if t == "all_of":
-        return all(evaluate(sub, ids) for sub in subs)
+        return remember_last(lambda ids: all(sub(ids) for sub in subs))
     elif t == "one_of":
-        return any(evaluate(sub, ids) for sub in subs)
+        return remember_last(lambda ids: any(sub(ids) for sub in subs))
     elif t == "at_least":
         required = defn.get("min", len(subs))
-        return sum(1 for sub in subs if evaluate(sub, ids)) >= required
+        return remember_last(lambda ids: satisfies_at_least((sub(ids) for sub in subs), len(subs), required))
     else:
         raise ValueError(f"Unknown composite type: {t}")
 
-def main(def_file_path, input_file_path, output_file_path):
+def main(def_file_path: str, input_file_path: str, output_file_path: str) -> None:
     # Check that definitions JSON exists
     if not os.path.isfile(def_file_path):
         print(f"Error: Definition file '{def_file_path}' does not exist.", file=sys.stderr)
@@ -66,14 +128,6 @@ def main(def_file_path, input_file_path, output_file_path):
     if not os.path.isfile(input_file_path):
         print(f"Error: Input file '{input_file_path}' does not exist.", file=sys.stderr)
         sys.exit(1)
-    # Check that output directory exists and is writable
-    out_dir = os.path.dirname(output_file_path) or '.'
-    if not os.path.isdir(out_dir):
-        print(f"Error: Output directory '{out_dir}' does not exist.", file=sys.stderr)
-        sys.exit(1)
-    if not os.access(out_dir, os.W_OK):
-        print(f"Error: No write permission in output directory '{out_dir}'.", file=sys.stderr)
-        sys.exit(1)
 
     # Load difitition file
     try:
@@ -85,20 +139,36 @@ def main(def_file_path, input_file_path, output_file_path):
         print(f"Error: Cannot open JSON file '{def_file_path}': {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Load input TSV file
+    # Load input TSV file as a set for constant-time KO lookups
     try:
-        input_ids = load_tsv(input_file_path)
+        input_ids = frozenset(load_tsv(input_file_path))
     except IOError as e:
         print(f"Error: Cannot open TSV file '{input_file_path}': {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Write results to the output file in TSV format
-    with open(output_file_path, 'w', encoding='utf-8') as out:
-        for pw in definitions.get("pathway_list", []):
-            name = pw.get("pathway_name")
-            ok = evaluate(pw.get("definition", {}), input_ids)
-            mark = "Y" if ok else "N"
-            out.write(f"{name}\t{mark}\n")
+    # Compile each pathway definition once, sharing identical subtrees across pathways
+    cache: Dict[Tuple[Any, ...], Predicate] = {}
+    pathways = [(pw.get("pathway_name"), compile_definition(pw.get("definition", {}), cache))
+                for pw in definitions.get("pathway_list", [])]
+
+    # Evaluate all pathways before touching the output file
+    lines = [f"{name}\t{'Y' if is_satisfied(input_ids) else 'N'}\n" for name, is_satisfied in pathways]
+
+    # Create the output directory if it does not exist
+    out_dir = Path(output_file_path).parent
+    try:
+        out_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"Error: Cannot create output directory '{out_dir}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Write results to the output file in TSV format with a single write
+    try:
+        with open(output_file_path, 'w', encoding='utf-8', buffering=1 << 20) as out:
+            out.write(''.join(lines))
+    except PermissionError:
+        print(f"Error: No write permission for '{output_file_path}'.", file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == "__main__":
     if len(sys.argv) == 2 and sys.argv[1] == '--version':